@@ -3,13 +3,20 @@ This module offers a collection of static methods that can execute different com
 """
 
 import subprocess
+import threading
 from io import StringIO
+from collections import deque
+from functools import partial, lru_cache
+from types import CodeType
 from contextlib import redirect_stdout
 from duckduckgo_search import DDGS
 
 
 # pylint: disable=broad-exception-caught, exec-used, unspecified-encoding
 
+# Maximum number of characters of shell output kept per stream, the rest is dropped
+MAX_SHELL_OUTPUT_SIZE = 65536
+
 class Commands:
     """
     A collection of static methods that can execute different commands.
@@ -69,12 +76,29 @@ class Commands:
         Returns:
             str: The stdout produced by the executed Python code.
         """
+        code = Commands.compile_python(arg)
+
+        # Run in a fresh namespace, so nothing leaks into this module or between runs
         _stdout = StringIO()
         with redirect_stdout(_stdout):
-            exec(arg)
+            exec(code, {"__name__": "__main__"})
 
         return _stdout.getvalue()
 
+    @staticmethod
+    @lru_cache(maxsize=128)
+    def compile_python(arg: str) -> CodeType:
+        """
+        Compiles the input Python code. The most recently used code objects are cached.
+
+        Args:
+            arg (str): The input Python code.
+
+        Returns:
+            CodeType: The compiled code.
+        """
+        return compile(arg, "<agent>", "exec")
+
     @staticmethod
     def execute_shell(arg: str) -> str:
         """
@@ -86,12 +110,54 @@ class Commands:
         Returns:
             str: The stdout and stderr produced by the executed shell command.
         """
-        result = subprocess.run(arg, capture_output=True, shell=True, check=False)
+        stdout = deque(maxlen=MAX_SHELL_OUTPUT_SIZE)
+        stderr = deque(maxlen=MAX_SHELL_OUTPUT_SIZE)
+        sizes = {"STDOUT": 0, "STDERR": 0}
+
+        with subprocess.Popen(
+            arg,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            encoding="utf-8",
+            errors="replace"
+            ) as process:
+            readers = [
+                threading.Thread(
+                    target=Commands.read_tail, args=(process.stdout, stdout, sizes, "STDOUT")
+                ),
+                threading.Thread(
+                    target=Commands.read_tail, args=(process.stderr, stderr, sizes, "STDERR")
+                )
+            ]
+
+            for reader in readers:
+                reader.start()
+            for reader in readers:
+                reader.join()
+
+        truncated = [
+            f"{name} truncated, showing the last {MAX_SHELL_OUTPUT_SIZE} of {size} characters."
+            for (name, size) in sizes.items() if size > MAX_SHELL_OUTPUT_SIZE
+        ]
+        note = "\n".join(truncated) + "\n" if truncated else ""
+
+        return f"{note}STDOUT:\n{''.join(stdout)}\nSTDERR:\n{''.join(stderr)}"
 
-        stdout = result.stdout.decode("utf-8")
-        stderr = result.stderr.decode("utf-8")
+    @staticmethod
+    def read_tail(stream, buffer: deque, sizes: dict, name: str):
+        """
+        Reads a text stream until EOF, keeping only as much of its end as fits into the buffer.
 
-        return f"STDOUT:\n{stdout}\nSTDERR:\n{stderr}"
+        Args:
+            stream: The text stream to read.
+            buffer (deque): A bounded deque that receives the characters read.
+            sizes (dict): Counts the total number of characters read under `name`.
+            name (str): The name of the stream.
+        """
+        for chunk in iter(partial(stream.read, 4096), ""):
+            buffer.extend(chunk)
+            sizes[name] += len(chunk)
 
     @staticmethod
     def web_search(arg: str) -> str:
@@ -104,8 +170,21 @@ class Commands:
         Returns:
             str: The search results.
         """
+        return str(Commands.search_results(arg))
+
+    @staticmethod
+    def search_results(arg: str) -> list:
+        """
+        Searches the web using DuckDuckGo.
+
+        Args:
+            arg (str): The search query.
+
+        Returns:
+            list: The top 5 results, each a dict with title, href and body.
+        """
         ddgs = DDGS()
 
         ddgs_text_gen = ddgs.text(arg)
 
-        return str(list(ddgs_text_gen)[:5])
+        return list(ddgs_text_gen)[:5]
@@ -8,3 +8,10 @@ class InvalidLLMResponseError(Exception):
     Attributes:
         None
     """
+
+class ObjectiveMismatchError(Exception):
+    """Exception raised when a stored history belongs to a different objective.
+    
+    Attributes:
+        None
+    """
@@ -4,36 +4,71 @@ with a user and performs tasks, with support for real-time monitoring of its act
 its performance, and retaining memory of actions.
 """
 
-# pylint: disable=invalid-name, too-many-arguments, too-many-instance-attributes, unspecified-encoding
+# pylint: disable=invalid-name, too-many-arguments, too-many-instance-attributes, unspecified-encoding, too-many-lines
 
 import os
 import sys
-import re
+import mmap
+import hashlib
+import sqlite3
 import platform
-import urllib
+import textwrap
+from concurrent.futures import ThreadPoolExecutor, Future
 from pathlib import Path
-from urllib.request import urlopen
+from urllib.parse import urlsplit, urlunsplit
+import httpx
 from dotenv import load_dotenv
 from termcolor import colored
 import openai
+from langchain.schema import SystemMessage, HumanMessage
 from thinkgpt.llm import ThinkGPT
 import tiktoken
 from bs4 import BeautifulSoup
+from selectolax.lexbor import LexborHTMLParser
 from spinner import Spinner
+from summary_cache import cached_summary
 from commands import Commands
-from exceptions import InvalidLLMResponseError
+from exceptions import InvalidLLMResponseError, ObjectiveMismatchError
 
 
 operating_system = platform.platform()
 
-PROMPT = f"You are an autonomous agent running on {operating_system}." + '''
-OBJECTIVE: {objective} (e.g. "Find a recipe for chocolate chip cookies")
+# Fetches web search results in the background
+prefetch_executor = ThreadPoolExecutor(max_workers=5)
+
+# Summarizes chunks of large inputs concurrently, bounded to stay within rate limits
+summarizer_executor = ThreadPoolExecutor(max_workers=8)
+
+# Pre-summarizes prefetched web pages, kept separate so it never delays the agent's own requests
+background_summarizer_executor = ThreadPoolExecutor(max_workers=2)
+
+# OpenAI errors that may go away on their own. langchain already retries these with
+# backoff, but the agent can still recover once they outlast the retries.
+TRANSIENT_OPENAI_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.APIConnectionError,
+    openai.error.Timeout,
+    openai.error.ServiceUnavailableError
+)
+
+# Number of transient OpenAI failures in a row after which the session is ended
+MAX_CONSECUTIVE_FAILURES = 5
+
+# Shared by all web requests, so connections to the same host are reused
+http_client = httpx.Client(
+    http2=True,
+    headers={"User-Agent": "Mozilla/5.0 (compatible; MiniAGI)"},
+    timeout=30.0,
+    follow_redirects=True
+)
+
+# The system prompt is fully static, so it is byte-identical across calls and can serve as
+# a cacheable prefix once it is long enough. Everything that changes goes into USER_TEMPLATE.
+SYSTEM_PROMPT = f"You are an autonomous agent running on {operating_system}." + '''
+You are working towards an OBJECTIVE (e.g. "Find a recipe for chocolate chip cookies")
+on a step-by-step basis. You will be given the objective and the previous steps.
 
-You are working towards the objective on a step-by-step basis. Previous steps:
-
-{context}
-
-Your task is to respond with the next action.
 Supported commands are: 
 
 command | argument
@@ -100,6 +135,15 @@ with open('hello_world.txt', 'w') as f:
 <r>The objective is complete.</r><c>done</c>
 '''
 
+USER_TEMPLATE = '''OBJECTIVE: {objective}
+
+Previous steps:
+
+{context}
+
+Your task is to respond with the next action.
+'''
+
 CRITIC_PROMPT = '''
 You are a critic reviewing the actions of an autonomous agent.
 
@@ -141,6 +185,30 @@ RETRIEVAL_PROMPT = "You will be asked to process data from a URL or file. You do
 
 OBSERVATION_SUMMARY_HINT = "Summarize the text using short sentences and abbreviations."
 
+HISTORY_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS history (
+    step INTEGER PRIMARY KEY,
+    digest BLOB NOT NULL,
+    action TEXT NOT NULL,
+    observation TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS history_digest ON history (digest);
+CREATE TABLE IF NOT EXISTS summary (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    text TEXT NOT NULL,
+    last_step INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    objective TEXT NOT NULL
+);
+'''
+
+# Number of most recent actions shown to the agent as PREV ACTIONS
+PREV_ACTIONS_LIMIT = 32
+
+REPEATED_OBSERVATION = "Same result as before (repeated action)."
+
 HISTORY_SUMMARY_HINT = "You are an autonomous agent summarizing your history."\
     "Generate a new summary given the previous summary of your "\
     "history and your latest action. Include a list of all previous actions. Keep it short."\
@@ -154,14 +222,22 @@ class MiniAGI:
         agent: An instance of `ThinkGPT`, used to generate the agent's actions.
         summarizer: An instance of `ThinkGPT`, used to generate summaries of the agent's history.
         objective (str): The objective the agent is working towards.
+        prompt_head (str), prompt_tail (str): The agent prompt before and after the context.
+        critic_prompt_head (str), critic_prompt_tail (str): The same for the critic prompt.
         max_context_size (int): The maximum size of the agent's short-term memory (in tokens).
         max_memory_item_size (int): The maximum size of a memory item (in tokens).
         debug (bool): Indicates whether to print debug information.
+        history: A `sqlite3` connection to the agent's history of actions and its summary.
         summarized_history (str): The summarized history of the agent's actions.
+        summarized_step (int): The last step of the history that is part of the summary.
         criticism (str): The criticism of the agent's last action.
+        context (str): The cached context, or None if it needs to be rebuilt.
+        visible_digests (set): Digests of the actions whose observations the context shows.
         thought (str): The reasoning behind the agent's last action.
         proposed_command (str): The command proposed by the agent to be executed next.
         proposed_arg (str): The argument of the proposed command.
+        url_cache (dict): The text of web pages fetched during this run, keyed by URL.
+        prefetched (dict): Futures of web pages being fetched in the background, keyed by URL.
         encoding: The tokenizer's encoding of the agent model's vocabulary.
     """
 
@@ -172,7 +248,8 @@ class MiniAGI:
         objective: str,
         max_context_size: int,
         max_memory_item_size: int,
-        debug: bool = False
+        debug: bool = False,
+        history_file: str = ":memory:"
         ):
         """
         Constructs a `MiniAGI` instance.
@@ -184,6 +261,11 @@ class MiniAGI:
             max_context_size (int): The maximum context size in tokens for the agent's memory.
             max_memory_item_size (int): The maximum size of a memory item in tokens.
             debug (bool, optional): A flag to indicate whether to print debug information.
+            history_file (str, optional): The SQLite database the history is stored in.
+                An existing history is resumed. Kept in memory only by default.
+
+        Raises:
+            ObjectiveMismatchError: If the history file belongs to a different objective.
         """
 
         self.agent = ThinkGPT(
@@ -198,18 +280,64 @@ class MiniAGI:
             verbose=False
         )
         self.objective = objective
+
+        # The objective is fixed, so only the context has to be inserted on every step
+        (self.prompt_head, self.prompt_tail) = (
+            part.replace("{objective}", objective) for part in USER_TEMPLATE.split("{context}")
+        )
+        (self.critic_prompt_head, self.critic_prompt_tail) = (
+            part.replace("{objective}", objective) for part in CRITIC_PROMPT.split("{context}")
+        )
+
         self.max_context_size = max_context_size
         self.max_memory_item_size = max_memory_item_size
         self.debug = debug
 
-        self.summarized_history = ""
+        self.history = sqlite3.connect(history_file)
+        self.history.executescript(HISTORY_SCHEMA)
+        self.__check_session(objective)
+
+        (self.summarized_history, self.summarized_step) = self.history.execute(
+            "SELECT text, last_step FROM summary WHERE id = 0"
+        ).fetchone() or ("", 0)
+
         self.criticism = ""
+        self.context = None
+        self.visible_digests = set()
         self.thought = ""
         self.proposed_command = ""
         self.proposed_arg = ""
+        self.url_cache = {}
+        self.prefetched = {}
 
         self.encoding = tiktoken.encoding_for_model(self.agent.model_name)
 
+    def __check_session(self, objective: str):
+        """
+        Makes sure the history belongs to the objective. A new history is assigned to it.
+
+        Args:
+            objective (str): The objective for the agent.
+
+        Raises:
+            ObjectiveMismatchError: If the history belongs to a different objective.
+        """
+
+        row = self.history.execute("SELECT objective FROM session WHERE id = 0").fetchone()
+
+        if row is None:
+            if self.history.execute("SELECT 1 FROM history").fetchone() is not None:
+                raise ObjectiveMismatchError("The history file has no objective.")
+
+            with self.history:
+                self.history.execute(
+                    "INSERT INTO session (id, objective) VALUES (0, ?)", (objective,)
+                )
+        elif row[0] != objective:
+            raise ObjectiveMismatchError(
+                f"The history file belongs to a different objective: {row[0]}"
+            )
+
     def __update_memory(
             self,
             action: str,
@@ -228,52 +356,287 @@ class MiniAGI:
             update_summary (bool, optional): Determines whether to update the summary.
         """
 
-        if len(self.encoding.encode(observation)) > self.max_memory_item_size:
-            observation = self.summarizer.chunked_summarize(
+        # Actions whose result the agent saw in PREV ACTIONS of the last context, e.g.
+        # recurring errors, are recorded with a short marker instead of repeating (and
+        # summarizing) the observation. Whitespace differences are ignored.
+        digest = hashlib.blake2b(
+            " ".join(f"{action}\n{observation}".split()).encode("utf-8"),
+            digest_size=8
+        ).digest()
+
+        if digest in self.visible_digests:
+            observation = REPEATED_OBSERVATION
+        elif len(self.encoding.encode(observation)) > self.max_memory_item_size:
+            observation = self.__chunked_summarize(
                 observation, self.max_memory_item_size,
                 instruction_hint=OBSERVATION_SUMMARY_HINT
                 )
 
-        if "memorize_thoughts" in action:
-            new_memory = f"ACTION:\nmemorize_thoughts\nTHOUGHTS:\n{observation}\n"
-        else:
-            new_memory = f"ACTION:\n{action}\nRESULT:\n{observation}\n"
+        with self.history:
+            self.history.execute(
+                "INSERT INTO history (digest, action, observation) VALUES (?, ?, ?)",
+                (digest, action, observation)
+            )
 
         if update_summary:
-            self.summarized_history = self.summarizer.summarize(
-                f"Current summary:\n{self.summarized_history}\nAdd to summary:\n{new_memory}",
-                self.max_memory_item_size,
-                instruction_hint=HISTORY_SUMMARY_HINT
-                )
+            self.__update_summary()
+
+    @staticmethod
+    def __format_memory(action: str, observation: str) -> str:
+        """
+        Formats an action and its observation for the agent's context.
+
+        Args:
+            action (str): The action.
+            observation (str): The observation.
+
+        Returns:
+            str: The memory item.
+        """
+        if "memorize_thoughts" in action:
+            return f"ACTION:\nmemorize_thoughts\nTHOUGHTS:\n{observation}\n"
+
+        return f"ACTION:\n{action}\nRESULT:\n{observation}\n"
+
+    def __update_summary(self):
+        """
+        Folds the oldest half of the actions that are not summarized yet into the summary,
+        once they don't fit into a memory item anymore. This avoids re-summarizing the
+        whole history after every action. Actions that drop out of PREV ACTIONS before
+        that are folded in by `__get_context`.
+        """
+
+        rows = self.history.execute(
+            "SELECT step, action, observation FROM history WHERE step > ? ORDER BY step",
+            (self.summarized_step,)
+        ).fetchall()
+
+        memories = [self.__format_memory(action, observation) for (_, action, observation) in rows]
+
+        if sum(len(self.encoding.encode(memory)) for memory in memories) \
+                <= self.max_memory_item_size:
+            return
+
+        half = (len(memories) + 1) // 2
+
+        try:
+            self.__fold_into_summary(rows[:half])
+        except TRANSIENT_OPENAI_ERRORS:
+            # The action is already stored, its summary is updated after the next one
+            pass
+
+    def __fold_into_summary(self, rows: list):
+        """
+        Adds actions to the summary, in batches that fit into a memory item.
+
+        Args:
+            rows (list): The (step, action, observation) rows to add, in chronological order.
+        """
+
+        batch = []
+        batch_len = 0
+        batch_step = 0
+
+        for (step, action, observation) in rows:
+            memory = self.__format_memory(action, observation)
+            memory_len = len(self.encoding.encode(memory))
+
+            if batch and batch_len + memory_len > self.max_memory_item_size:
+                self.__summarize_batch(batch, batch_step)
+                batch = []
+                batch_len = 0
+
+            batch.append(memory)
+            batch_len += memory_len
+            batch_step = step
+
+        if batch:
+            self.__summarize_batch(batch, batch_step)
+
+    def __summarize_batch(self, memories: list, last_step: int):
+        """
+        Adds memories to the summary and stores the new summary.
+
+        Args:
+            memories (list): The memories to add, in chronological order.
+            last_step (int): The step of the last memory.
+        """
+
+        self.summarized_history = self.__summarize(
+            f"Current summary:\n{self.summarized_history}\nAdd to summary:\n"
+            + "\n".join(memories),
+            self.max_memory_item_size,
+            instruction_hint=HISTORY_SUMMARY_HINT
+            )
+        self.summarized_step = last_step
+
+        with self.history:
+            self.history.execute(
+                "INSERT OR REPLACE INTO summary (id, text, last_step) VALUES (0, ?, ?)",
+                (self.summarized_history, self.summarized_step)
+            )
+
+    @cached_summary
+    def __summarize(self, content: str, max_tokens: int, instruction_hint: str = "") -> str:
+        """
+        Summarizes the content using the summarizer. Results are cached on disk.
+
+        Args:
+            content (str): The content to summarize.
+            max_tokens (int): The maximum size of the summary in tokens.
+            instruction_hint (str, optional): Additional instructions for the summarizer.
+
+        Returns:
+            str: The summary.
+        """
+        return self.summarizer.summarize(
+            content, max_tokens,
+            instruction_hint=instruction_hint
+            )
+
+    @cached_summary
+    def __chunked_summarize(
+            self,
+            content: str,
+            max_tokens: int,
+            instruction_hint: str = "",
+            executor: ThreadPoolExecutor = summarizer_executor
+        ) -> str:
+        """
+        Summarizes the content chunk by chunk using the summarizer.
+        Same as `ThinkGPT.chunked_summarize`, but the chunks are summarized concurrently.
+        Results are cached on disk.
+
+        Args:
+            content (str): The content to summarize.
+            max_tokens (int): The maximum size of the summary in tokens.
+            instruction_hint (str, optional): Additional instructions for the summarizer.
+            executor (ThreadPoolExecutor, optional): The pool the chunks are summarized on.
+
+        Returns:
+            str: The summary.
+        """
+        num_tokens = len(self.encoding.encode(content))
+
+        if num_tokens <= max_tokens:
+            return content
+
+        avg_chars_per_token = len(content) / num_tokens
+        chunk_size = int(
+            avg_chars_per_token * self.summarizer.summarize_chain.summarizer_chunk_size
+        )
+        chunks = textwrap.wrap(content, chunk_size)
+        summary_size = int(max_tokens / len(chunks))
+
+        summaries = executor.map(
+            lambda chunk: self.__summarize(chunk, summary_size, instruction_hint),
+            chunks
+        )
+
+        return "\n".join(summaries)
+
+    def __fit_memories(self, memories: list, max_tokens: int) -> list:
+        """
+        Selects the most recent memories that fit into the given number of tokens.
+        Candidates are picked using a cheap estimate of 4 characters per token, with
+        a 10% margin, and only those are tokenized to enforce the exact limit.
+
+        Args:
+            memories (list): The memories in chronological order.
+            max_tokens (int): The maximum total size of the memories in tokens.
+
+        Returns:
+            list: The most recent memories that fit, in chronological order.
+        """
+
+        candidates = []
+        estimate = 0
+
+        for memory in reversed(memories):
+            estimate += len(memory) // 4
+            if estimate > max_tokens * 1.1:
+                break
+            candidates.append(memory)
+
+        result = []
+        total = 0
 
-        self.agent.memorize(new_memory)
+        for memory in candidates:
+            total += len(self.encoding.encode(memory))
+            if total > max_tokens:
+                break
+            result.append(memory)
+
+        result.reverse()
+
+        return result
 
     def __get_context(self) -> str:
         """
         Retrieves the context for the agent to think and act upon. 
+        The context is only rebuilt after the memory or the criticism changed.
+        Actions that aren't summarized yet but don't fit into PREV ACTIONS anymore
+        are folded into the summary first, so every action is covered by one of them.
 
         Returns:
             str: The agent's context.
         """
 
-        summary_len = len(self.encoding.encode(self.summarized_history))
+        if self.context is not None:
+            return self.context
 
         if len(self.criticism) > 0:
             criticism_len = len(self.encoding.encode(self.criticism))
         else:
             criticism_len = 0
 
-        action_buffer = "\n".join(
-                self.agent.remember(
-                limit=32,
-                sort_by_order=True,
-                max_tokens=self.max_context_size - summary_len - criticism_len
+        rows = self.history.execute(
+            "SELECT step, digest, action, observation FROM history ORDER BY step DESC LIMIT ?",
+            (PREV_ACTIONS_LIMIT,)
+        ).fetchall()
+        rows.reverse()
+
+        memories = [
+            self.__format_memory(action, observation) for (_, _, action, observation) in rows
+        ]
+
+        while True:
+            summary_len = len(self.encoding.encode(self.summarized_history))
+
+            visible = self.__fit_memories(
+                memories, self.max_context_size - summary_len - criticism_len
             )
-        )
 
-        return f"SUMMARY\n{self.summarized_history}\nPREV ACTIONS:"\
+            # The first step that is shown in PREV ACTIONS
+            if visible:
+                first_visible_step = rows[len(rows) - len(visible)][0]
+            else:
+                first_visible_step = rows[-1][0] + 1 if rows else 0
+
+            hidden = self.history.execute(
+                "SELECT step, action, observation FROM history WHERE step > ? AND step < ?"
+                " ORDER BY step",
+                (self.summarized_step, first_visible_step)
+            ).fetchall()
+
+            if not hidden:
+                break
+
+            # The summary may have grown, so check again what still fits
+            self.__fold_into_summary(hidden)
+
+        self.visible_digests = {
+            digest for (_, digest, _, observation) in rows[len(rows) - len(visible):]
+            if observation != REPEATED_OBSERVATION
+        }
+
+        action_buffer = "\n".join(visible)
+
+        self.context = f"SUMMARY\n{self.summarized_history}\nPREV ACTIONS:"\
             f"\n{action_buffer}\n{self.criticism}"
 
+        return self.context
+
     def criticize(self) -> str:
         """
         Criticizes the agent's actions.
@@ -284,8 +647,9 @@ class MiniAGI:
         context = self.__get_context()
 
         self.criticism = self.agent.predict(
-                prompt=CRITIC_PROMPT.format(context=context, objective=self.objective)
+                prompt=self.critic_prompt_head + context + self.critic_prompt_tail
             )
+        self.context = None
 
         return self.criticism
 
@@ -299,24 +663,26 @@ class MiniAGI:
         if self.debug:
             print(context)
 
-        response_text = self.agent.predict(
-            prompt=PROMPT.format(context=context, objective=self.objective)
-        )
+        response_text = self.agent.openai([
+            SystemMessage(content=SYSTEM_PROMPT),
+            HumanMessage(content=self.prompt_head + context + self.prompt_tail)
+        ]).content
 
         if self.debug:
             print(f"RAW RESPONSE:\n{response_text}")
 
-        PATTERN = r'^<r>(.*?)</r><c>(.*?)</c>\n*(.*)$'
-
+        # Expected format: <r>[REASONING]</r><c>[COMMAND]</c>, followed by the argument
         try:
-            match = re.search(PATTERN, response_text, flags=re.DOTALL | re.MULTILINE)
-
-            _thought = match[1]
-            _command = match[2]
-            _arg = match[3]
-        except Exception as exc:
+            thought_start = response_text.index("<r>") + 3
+            command_start = response_text.index("</r><c>", thought_start) + 7
+            command_end = response_text.index("</c>", command_start)
+        except ValueError as exc:
             raise InvalidLLMResponseError from exc
 
+        _thought = response_text[thought_start:command_start - 7]
+        _command = response_text[command_start:command_end]
+        _arg = response_text[command_end + 4:].lstrip("\n")
+
         # Remove unwanted code formatting backticks
         _arg = _arg.replace("```", "")
 
@@ -342,9 +708,159 @@ class MiniAGI:
         )
 
     @staticmethod
-    def __get_url_or_file(_arg: str) -> str:
+    def __normalize_url(url: str) -> str:
+        """
+        Normalizes an URL so that equivalent URLs map to the same cache entry.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            str: The normalized URL.
+
+        Raises:
+            httpx.InvalidURL: If the URL can't be parsed.
+        """
+        try:
+            parts = urlsplit(url.strip())
+        except ValueError as e:
+            raise httpx.InvalidURL(str(e)) from e
+
+        return urlunsplit((
+            parts.scheme.lower(),
+            parts.netloc.lower(),
+            parts.path or "/",
+            parts.query,
+            ""
+        ))
+
+    @staticmethod
+    def __html_to_text(html: bytes) -> str:
+        """
+        Extracts the text from a HTML document.
+
+        Args:
+            html (bytes): The HTML document.
+
+        Returns:
+            str: The text content of the document.
+        """
+        try:
+            body = LexborHTMLParser(html).body
+        except ValueError:
+            body = None
+
+        # Fall back to BeautifulSoup for documents selectolax can't make sense of
+        if body is None:
+            return BeautifulSoup(html, features="lxml").get_text()
+
+        return body.text(separator=" ", strip=True)
+
+    def __fetch_url(self, url: str) -> str:
+        """
+        Fetches a web page and stores its text in the URL cache.
+
+        Args:
+            url (str): The URL.
+
+        Returns:
+            str: The text content of the web page.
+        """
+        url = self.__normalize_url(url)
+
+        response = http_client.get(url)
+        response.raise_for_status()
+        html = response.content
+        data = self.__html_to_text(html)
+        self.url_cache[url] = data
+
+        return data
+
+    def __warm_summary(self, fetch: Future):
+        """
+        Pre-summarizes a prefetched web page the way `ingest_data` would, so the
+        summary is in the cache. Runs in the background, see `__web_search`.
+
+        Args:
+            fetch (Future): The future fetching the web page.
+        """
+        if fetch.exception() is not None:
+            return
+
+        data = fetch.result()
+
+        if len(self.encoding.encode(data)) > self.max_memory_item_size:
+            try:
+                self.__chunked_summarize(
+                    data, self.max_memory_item_size,
+                    instruction_hint=OBSERVATION_SUMMARY_HINT,
+                    executor=background_summarizer_executor
+                    )
+            except openai.error.OpenAIError:
+                # Only a cache warmup, ingest_data will summarize again if needed
+                pass
+
+    def __web_search(self, _arg: str) -> str:
+        """
+        Searches the web and starts fetching the result pages in the background,
+        so a subsequent ingest_data or process_data on one of them is fast.
+
+        Args:
+            arg (str): The search query.
+
+        Returns:
+            str: Observation: The search results.
+        """
+
+        try:
+            results = Commands.search_results(_arg)
+        except Exception as exception: # pylint: disable=broad-exception-caught
+            return f"Command returned an error:\n{str(exception)}"
+
+        for result in results:
+            url = result.get("href", "")
+
+            if not (url.startswith("http://") or url.startswith("https://")):
+                continue
+
+            try:
+                url = self.__normalize_url(url)
+            except httpx.InvalidURL:
+                continue
+
+            if url not in self.url_cache and url not in self.prefetched:
+                # Fetching and summarizing are separate jobs, so process_data can use
+                # the text without waiting for the summary.
+                fetch = prefetch_executor.submit(self.__fetch_url, url)
+                self.prefetched[url] = fetch
+                prefetch_executor.submit(self.__warm_summary, fetch)
+
+        return str(results)
+
+    @staticmethod
+    def __read_file(path: str) -> str:
+        """
+        Reads a text file. The file is memory-mapped and decoded in place,
+        so its contents are not held in memory twice.
+
+        Args:
+            path (str): The filename.
+
+        Returns:
+            str: The contents of the file.
+        """
+        with open(path, "rb") as file:
+            try:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return str(mapped, "utf-8", errors="replace")
+            except (ValueError, OSError):
+                # Empty files and special files like pipes or /proc entries can't be mapped
+                return file.read().decode("utf-8", errors="replace")
+
+    def __get_url_or_file(self, _arg: str) -> str:
         """
         Retrieve contents from an URL or file.
+        Web pages are fetched at most once per run.
 
         Args:
             arg (str): URL or filename
@@ -353,16 +869,24 @@ class MiniAGI:
             str: Observation: The contents of the URL or file.
         """
 
-        if arg.startswith("http://") or arg.startswith("https://"):
-            with urlopen(_arg) as response:
-                html = response.read()
-            data = BeautifulSoup(
-                    html,
-                    features="lxml"
-                ).get_text()
+        if _arg.startswith("http://") or _arg.startswith("https://"):
+            url = self.__normalize_url(_arg)
+
+            if url in self.url_cache:
+                return self.url_cache[url]
+
+            prefetch = self.prefetched.pop(url, None)
+
+            if prefetch is not None:
+                try:
+                    return prefetch.result()
+                except (httpx.HTTPError, httpx.InvalidURL, OSError):
+                    # The prefetch may have hit a transient error, retry it
+                    pass
+
+            data = self.__fetch_url(url)
         else:
-            with open(_arg, "r") as file:
-                data = file.read()
+            data = self.__read_file(_arg)
 
         return data
 
@@ -388,13 +912,13 @@ class MiniAGI:
 
         try:
             input_data = self.__get_url_or_file(__arg)
-        except urllib.error.URLError as e:
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
             return f"Error: {str(e)}"
         except OSError as e:
             return f"Error: {str(e)}"
 
         if len(self.encoding.encode(input_data)) > self.max_context_size:
-            input_data = self.summarizer.chunked_summarize(
+            input_data = self.__chunked_summarize(
                 input_data, self.max_context_size,
                 instruction_hint=OBSERVATION_SUMMARY_HINT
                 )
@@ -416,13 +940,13 @@ class MiniAGI:
 
         try:
             data = self.__get_url_or_file(_arg)
-        except urllib.error.URLError as e:
+        except (httpx.HTTPError, httpx.InvalidURL) as e:
             return f"Error: {str(e)}"
         except OSError as e:
             return f"Error: {str(e)}"
 
         if len(self.encoding.encode(data)) > self.max_memory_item_size:
-            data = self.summarizer.chunked_summarize(
+            data = self.__chunked_summarize(
                 data, self.max_memory_item_size,
                 instruction_hint=OBSERVATION_SUMMARY_HINT
                 )
@@ -433,15 +957,20 @@ class MiniAGI:
         """
         Executes the command proposed by the agent and updates the agent's memory.
         """
-        if command == "process_data":
+        if self.proposed_command == "process_data":
             obs = self.__process_data(self.proposed_arg)
-        elif command == "ingest_data":
+        elif self.proposed_command == "ingest_data":
             obs = self.__ingest_data(self.proposed_arg)
+        elif self.proposed_command == "web_search":
+            obs = self.__web_search(self.proposed_arg)
         else:
             obs = Commands.execute_command(self.proposed_command, self.proposed_arg)
 
-        self.__update_memory(f"{self.proposed_command}\n{self.proposed_arg}", obs)
-        self.criticism = ""
+        try:
+            self.__update_memory(f"{self.proposed_command}\n{self.proposed_arg}", obs)
+        finally:
+            self.criticism = ""
+            self.context = None
 
     def user_response(self, response):
         """
@@ -450,8 +979,11 @@ class MiniAGI:
         Args:
             response (str): The user's response to the agent's last action.
         """
-        self.__update_memory(f"{self.proposed_command}\n{self.proposed_arg}", response)
-        self.criticism = ""
+        try:
+            self.__update_memory(f"{self.proposed_command}\n{self.proposed_arg}", response)
+        finally:
+            self.criticism = ""
+            self.context = None
 
 def get_bool_env(env_var: str) -> bool:
     '''
@@ -461,6 +993,22 @@ def get_bool_env(env_var: str) -> bool:
     '''
     return os.getenv(env_var) in ['true', '1', 't', 'y', 'yes']
 
+def cancel_background_tasks():
+    '''
+    Cancels pending prefetches and summary warmups, so exiting doesn't wait for them.
+    '''
+    prefetch_executor.shutdown(wait=False, cancel_futures=True)
+    background_summarizer_executor.shutdown(wait=False, cancel_futures=True)
+
+def exit_on_openai_error(e: openai.error.OpenAIError):
+    '''
+    Ends the session after an OpenAI error that retrying won't fix.
+    Args:
+        e (openai.error.OpenAIError): The error
+    '''
+    print(colored(f"OpenAI request failed, exiting.\n{str(e)}", "red"))
+    sys.exit(1)
+
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -489,54 +1037,121 @@ if __name__ == "__main__":
         print("Directory doesn't exist. Set WORK_DIR to an existing directory or leave it blank.")
         sys.exit(0)
 
-    miniagi = MiniAGI(
-        os.getenv("MODEL"),
-        os.getenv("SUMMARIZER_MODEL"),
-        sys.argv[1],
-        int(os.getenv("MAX_CONTEXT_SIZE")),
-        int(os.getenv("MAX_MEMORY_ITEM_SIZE")),
-        get_bool_env("DEBUG")
-    )
-
-    while True:
-
-        try:
-            with Spinner():
-                miniagi.think()
-        except InvalidLLMResponseError:
-            print(colored("Invalid LLM response, retrying...", "red"))
-            continue
-
-        (thought, command, arg) = miniagi.read_mind()
-
-        print(colored(f"MiniAGI: {thought}\nCmd: {command}, Arg: {arg}", "cyan"))
-
-        if command == "done":
-            sys.exit(0)
+    try:
+        miniagi = MiniAGI(
+            os.getenv("MODEL"),
+            os.getenv("SUMMARIZER_MODEL"),
+            sys.argv[1],
+            int(os.getenv("MAX_CONTEXT_SIZE")),
+            int(os.getenv("MAX_MEMORY_ITEM_SIZE")),
+            get_bool_env("DEBUG"),
+            os.getenv("HISTORY_FILE") or ":memory:"
+        )
+    except ObjectiveMismatchError as e:
+        print(f"{str(e)}\nSet HISTORY_FILE to a new file or leave it blank.")
+        sys.exit(0)
 
-        if command == "talk_to_user":
-            print(colored(f"MiniAGI: {miniagi.proposed_arg}", 'blue'))
-            user_input = input('Your response: ')
-            with Spinner():
-                miniagi.user_response(user_input)
-            continue
+    # Transient OpenAI failures since the last completed step
+    failures = 0
 
-        if command == "memorize_thoughts":
-            print(colored("MiniAGI is thinking:\n"\
-                f"{miniagi.proposed_arg}", 'cyan'))
-        elif PROMPT_USER:
-            user_input = input('Press enter to continue or abort this action by typing feedback: ')
+    # Don't let pending background tasks run on after the session ends, however it ends
+    try:
+        while True:
 
-            if len(user_input) > 0:
+            try:
                 with Spinner():
-                    miniagi.user_response(user_input)
+                    miniagi.think()
+            except InvalidLLMResponseError:
+                print(colored("Invalid LLM response, retrying...", "red"))
+                continue
+            except TRANSIENT_OPENAI_ERRORS as e:
+                failures += 1
+                if failures >= MAX_CONSECUTIVE_FAILURES:
+                    exit_on_openai_error(e)
+                print(colored(f"OpenAI request failed, retrying...\n{str(e)}", "red"))
+                continue
+            except openai.error.OpenAIError as e:
+                exit_on_openai_error(e)
+
+            (thought, command, arg) = miniagi.read_mind()
+
+            # Collect the output of this step and write it at once
+            output = [colored(f"MiniAGI: {thought}\nCmd: {command}, Arg: {arg}", "cyan")]
+
+            if command == "talk_to_user":
+                output.append(colored(f"MiniAGI: {miniagi.proposed_arg}", 'blue'))
+            elif command == "memorize_thoughts":
+                output.append(colored("MiniAGI is thinking:\n"\
+                    f"{miniagi.proposed_arg}", 'cyan'))
+
+            print("\n".join(output), flush=True)
+
+            if command == "done":
+                sys.exit(0)
+
+            if command == "talk_to_user":
+                user_input = input('Your response: ')
+                try:
+                    with Spinner():
+                        miniagi.user_response(user_input)
+                except TRANSIENT_OPENAI_ERRORS as e:
+                    failures += 1
+                    if failures >= MAX_CONSECUTIVE_FAILURES:
+                        exit_on_openai_error(e)
+                    print(colored("OpenAI request failed, the response was not memorized."\
+                        f"\n{str(e)}", "red"))
+                    continue
+                except openai.error.OpenAIError as e:
+                    exit_on_openai_error(e)
+                failures = 0
                 continue
 
-        with Spinner():
-            miniagi.act()
-
-        if ENABLE_CRITIC:
-            with Spinner():
-                criticism = miniagi.criticize()
+            if command != "memorize_thoughts" and PROMPT_USER:
+                user_input = input(
+                    'Press enter to continue or abort this action by typing feedback: '
+                )
 
-            print(colored(criticism, "light_magenta"))
+                if len(user_input) > 0:
+                    try:
+                        with Spinner():
+                            miniagi.user_response(user_input)
+                    except TRANSIENT_OPENAI_ERRORS as e:
+                        failures += 1
+                        if failures >= MAX_CONSECUTIVE_FAILURES:
+                            exit_on_openai_error(e)
+                        print(colored("OpenAI request failed, the feedback was not memorized."\
+                            f"\n{str(e)}", "red"))
+                        continue
+                    except openai.error.OpenAIError as e:
+                        exit_on_openai_error(e)
+                    failures = 0
+                    continue
+
+            try:
+                with Spinner():
+                    miniagi.act()
+            except TRANSIENT_OPENAI_ERRORS as e:
+                failures += 1
+                if failures >= MAX_CONSECUTIVE_FAILURES:
+                    exit_on_openai_error(e)
+                print(colored("OpenAI request failed, the result of the action was not memorized."\
+                    f"\n{str(e)}", "red"))
+                continue
+            except openai.error.OpenAIError as e:
+                exit_on_openai_error(e)
+
+            failures = 0
+
+            if ENABLE_CRITIC:
+                try:
+                    with Spinner():
+                        criticism = miniagi.criticize()
+                except TRANSIENT_OPENAI_ERRORS as e:
+                    print(colored(f"OpenAI request failed, skipping criticism.\n{str(e)}", "red"))
+                    continue
+                except openai.error.OpenAIError as e:
+                    exit_on_openai_error(e)
+
+                print(colored(criticism, "light_magenta"))
+    finally:
+        cancel_background_tasks()
@@ -0,0 +1,66 @@
+"""
+This module provides an on-disk cache for summaries, so identical content is only
+sent to the summarizer once.
+"""
+
+import os
+import hashlib
+import tempfile
+import functools
+
+# Relative to the current working directory, i.e. MiniAGI's working directory.
+SUMMARY_CACHE_DIR = ".summary_cache"
+
+def cached_summary(func):
+    """
+    Decorator for summarizer methods with the signature
+    `(self, content, max_tokens, instruction_hint)`, where `self.summarizer` is the
+    `ThinkGPT` instance doing the summarization. The summary is stored in
+    SUMMARY_CACHE_DIR under the hash of the summarizer model, the method name and
+    all arguments. Additional keyword arguments are passed through but not part of the key.
+
+    Args:
+        func: The summarizer method to wrap.
+
+    Returns:
+        The wrapped method.
+    """
+
+    @functools.wraps(func)
+    def wrapper(
+            self,
+            content: str,
+            max_tokens: int,
+            instruction_hint: str = "",
+            **kwargs
+        ) -> str:
+        key = hashlib.sha256(
+            f"{self.summarizer.model_name}\n{func.__name__}\n{instruction_hint}\n{max_tokens}\n"
+            f"{content}".encode("utf-8")
+        ).hexdigest()
+        path = os.path.join(SUMMARY_CACHE_DIR, f"{key}.txt")
+
+        try:
+            with open(path, "r", encoding="utf-8") as file:
+                return file.read()
+        except OSError:
+            pass
+
+        summary = func(self, content, max_tokens, instruction_hint, **kwargs)
+
+        # Write to a temporary file first so an interrupted write never leaves
+        # a truncated summary behind.
+        tmp_path = None
+        try:
+            os.makedirs(SUMMARY_CACHE_DIR, exist_ok=True)
+            (fd, tmp_path) = tempfile.mkstemp(dir=SUMMARY_CACHE_DIR, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as file:
+                file.write(summary)
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        return summary
+
+    return wrapper